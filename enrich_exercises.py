@@ -12,13 +12,26 @@ allowing the script to resume from where it left off.
 Supports local LLM models from Hugging Face (optimized for CPU)
 """
 
+import atexit
+import copy
+import glob
+import hashlib
+import importlib.util
 import json
+import math
+import mmap
+import multiprocessing
 import os
+import shutil
+import signal
 import sys
-from typing import Dict, List, Any, Optional
-from datetime import datetime
 import time
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+from datetime import datetime
 import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Suppress warnings for cleaner output
 warnings.filterwarnings("ignore")
@@ -29,14 +42,164 @@ try:
 except ImportError:
     load_dotenv = None
 
+# Try importing json5 to accept near-JSON responses (trailing commas, single quotes)
+try:
+    import json5
+except ImportError:
+    json5 = None
+
+# Try importing ijson to stream the input file instead of parsing it all at once
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Try importing orjson for fast JSON (falls back to the standard library)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps(obj: Any, indent: bool = False, sort_keys: bool = False, newline: bool = False) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        # Like json.dumps, serialize non-string keys (e.g. exercise IDs) as strings
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if newline:
+            option |= orjson.OPT_APPEND_NEWLINE
+        return orjson.dumps(obj, option=option)
+
+    data = json.dumps(
+        obj,
+        ensure_ascii=False,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+        sort_keys=sort_keys,
+    ).encode("utf-8")
+    return data + b"\n" if newline else data
+
+
+def json_loads(data) -> Any:
+    """Parse JSON from str, bytes or a buffer (orjson when installed).
+
+    Both parsers raise json.JSONDecodeError (a ValueError) on invalid input.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def sysfs_physical_core_count() -> Optional[int]:
+    """Count the physical cores among the allowed CPUs from the Linux CPU topology.
+
+    Hyper-thread siblings share the same (physical_package_id, core_id), so
+    they are counted once. Returns None where sysfs is not available.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = os.sched_getaffinity(0)
+    else:
+        cpus = range(os.cpu_count() or 1)
+
+    cores = set()
+    try:
+        for cpu in cpus:
+            topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+            with open(os.path.join(topology, "physical_package_id"), "r", encoding="utf-8") as f:
+                package = f.read().strip()
+            with open(os.path.join(topology, "core_id"), "r", encoding="utf-8") as f:
+                core = f.read().strip()
+            cores.add((package, core))
+    except OSError:
+        return None
+    return len(cores) or None
+
+
+def physical_core_count() -> int:
+    """Count the physical cores this process is allowed to run on."""
+    logical = os.cpu_count() or 1
+    try:
+        import psutil
+
+        cores = psutil.cpu_count(logical=False) or logical
+    except ImportError:
+        # Already limited to the allowed CPUs
+        cores = sysfs_physical_core_count()
+        if cores is not None:
+            return cores
+        print(
+            "⚠️  psutil no está instalado y no se pudo leer la topología de la CPU: "
+            f"se usa un hilo por CPU lógica ({logical})"
+        )
+        cores = logical
+
+    # Scale down when restricted to a subset of CPUs (e.g. by numactl/taskset)
+    if hasattr(os, "sched_getaffinity"):
+        cores = cores * len(os.sched_getaffinity(0)) // logical
+    return max(1, cores)
+
+
+PHYSICAL_CORES = physical_core_count()
+
+# Heavy ML dependencies, imported by lazy_imports() once threading is configured
+torch = None
+transformers = None
+
+
+def configure_threading():
+    """Pin the OpenMP/MKL runtimes used by PyTorch to one thread per physical core.
+
+    These variables are read once, when torch is imported: if they are set
+    afterwards (or torch was imported first) OpenMP ignores them and
+    torch.set_num_threads() cannot undo the oversubscription. This must run
+    before lazy_imports(). Values already in the environment win.
+    """
+    os.environ.setdefault("OMP_NUM_THREADS", str(PHYSICAL_CORES))
+    os.environ.setdefault("MKL_NUM_THREADS", str(PHYSICAL_CORES))
+    os.environ.setdefault("KMP_AFFINITY", "granularity=fine,compact,1,0")
+    os.environ.setdefault("KMP_BLOCKTIME", "1")
+    os.environ.setdefault("MALLOC_CONF", "background_thread:true")
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def lazy_imports():
+    """Import torch and transformers into the module namespace."""
+    global torch, transformers
+
+    import torch
+    import transformers
+
+
 # File paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_FILE = os.path.join(BASE_DIR, "input", "exercicies_mock.json")
 OUTPUT_FILE = os.path.join(BASE_DIR, "output", "enriched_exercises.json")
+OUTPUT_LOG_FILE = os.path.join(BASE_DIR, "output", "enriched_exercises.jsonl")
 PROGRESS_FILE = os.path.join(BASE_DIR, "output", "processing_progress.json")
+PROGRESS_BITS_FILE = os.path.join(BASE_DIR, "output", "processing_progress.bits")
+PROMPT_CACHE_FILE = os.path.join(BASE_DIR, "output", "prompt_cache.jsonl")
+SNAPSHOT_INTERVAL = 50  # Rewrite the full JSON output every N enriched exercises
+PROGRESS_FLUSH_INTERVAL = 10  # Sync the progress bitmap to disk every N exercises
 
 # Local model constants
 MODELS_DIR = os.path.join(BASE_DIR, "models")  # Directory to cache models
+BATCH_SIZE = 8  # Exercises generated together in a single model call
+CORES_PER_REPLICA = 16  # Physical cores per model replica on large machines
+BATCH_GROW_AFTER = 4  # Successful generate() calls before a reduced batch size grows by one
+MAX_PROMPT_TOKENS = 1800  # Leave room for generated tokens
+MAX_NEW_TOKENS = 350  # A complete enrichment JSON is ~200 tokens
+GENERATION_TEMPERATURE = 0.0  # Greedy decoding, so cached responses stay valid
+GENERATION_STOP_STRINGS = ["}\n\n", "</s>", "<|end|>"]
+MAX_EXISTING_NAMES = 2  # Existing translation names included in each prompt
+MAX_EXISTING_NAME_CHARS = 400  # Longer names are truncated in the prompt
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # Embeddings for near-duplicate reuse
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Minimum cosine similarity to reuse a cached response
 
 # Available models optimized for CPU with low RAM
 AVAILABLE_MODELS = {
@@ -45,38 +208,341 @@ AVAILABLE_MODELS = {
         "description": "Qwen 1.5B - Rápido y ligero (1.5B parámetros) [RECOMENDADO]",
         "ram_requirement": "~3GB RAM",
         "speed": "Rápido en CPU",
+        "quantization": "int8",
+        "gguf_repo": "Qwen/Qwen2-1.5B-Instruct-GGUF",
+        "gguf_file": "*q4_k_m.gguf",
     },
     "tinyllama-1.1b": {
         "name": "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
         "description": "TinyLlama 1.1B - El más rápido (1.1B parámetros)",
         "ram_requirement": "~2.5GB RAM",
         "speed": "Muy rápido en CPU",
+        "quantization": "int8",
+        "gguf_repo": "TheBloke/TinyLlama-1.1B-Chat-v1.0-GGUF",
+        "gguf_file": "*Q4_K_M.gguf",
     },
     "phi3-mini": {
         "name": "microsoft/Phi-3-mini-4k-instruct",
         "description": "Phi-3 Mini - Mejor calidad pero más lento (3.8B parámetros)",
         "ram_requirement": "~5-6GB RAM",
         "speed": "Lento en CPU",
+        "quantization": "int4",
+        "gguf_repo": "microsoft/Phi-3-mini-4k-instruct-gguf",
+        "gguf_file": "*q4.gguf",
+    },
+}
+
+# Static part of the enrichment prompt (identical for every exercise).
+# It is kept at the start of the prompt so its KV cache can be computed once.
+STATIC_PROMPT_PREFIX = """Fitness expert: Enrich the exercise info below as JSON.
+
+Return JSON with this structure:
+{
+  "primary_muscle": {"name": "Spanish", "name_en": "English"},
+  "translations": [
+    {"name": "Title", "description": "2-3 sentences", "language": 2, "aliases": ["Alt1", "Alt2"], "notes": ["Tip1", "Tip2"]},
+    {"name": "Título", "description": "2-3 oraciones", "language": 4, "aliases": ["Alt1", "Alt2"], "notes": ["Consejo1", "Consejo2"]}
+  ]
+}
+
+Rules: language=int (2=English, 4=Spanish), include 2+ aliases and notes.
+- Do not include any markdown formatting, code blocks, or additional text
+- Return only the raw JSON object
+
+"""
+
+# Per-exercise part of the prompt, filled in with str.format_map after the static prefix
+EXERCISE_PROMPT_TEMPLATE = """Category: {category}
+Equipment: {equipment}
+
+{existing_info}"""
+
+# JSON schema of the enrichment response, used to constrain decoding
+ENRICHED_DATA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "primary_muscle": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "name_en": {"type": "string"},
+            },
+            "required": ["name", "name_en"],
+        },
+        "translations": {
+            "type": "array",
+            "minItems": 2,
+            "maxItems": 2,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "language": {"type": "integer", "enum": [2, 4]},
+                    "aliases": {"type": "array", "items": {"type": "string"}},
+                    "notes": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["name", "description", "language", "aliases", "notes"],
+            },
+        },
+    },
+    "required": ["primary_muscle", "translations"],
+}
+
+# Response validation rules, read from the same schema that constrains decoding
+REQUIRED_MUSCLE_FIELDS = frozenset(ENRICHED_DATA_SCHEMA["properties"]["primary_muscle"]["required"])
+TRANSLATION_COUNT = ENRICHED_DATA_SCHEMA["properties"]["translations"]["maxItems"]
+REQUIRED_TRANSLATION_FIELDS = frozenset(
+    ENRICHED_DATA_SCHEMA["properties"]["translations"]["items"]["required"]
+)
+TRANSLATION_LANGUAGES = frozenset(
+    ENRICHED_DATA_SCHEMA["properties"]["translations"]["items"]["properties"]["language"]["enum"]
+)
+
+# Placeholder used to locate where the exercise data starts in a formatted prompt
+PROMPT_SPLIT_MARKER = "<<EXERCISE>>"
+
+# Available inference backends
+AVAILABLE_BACKENDS = {
+    "transformers": {
+        "description": "Transformers (PyTorch) - Compatible con todos los modelos",
+    },
+    "llama.cpp": {
+        "description": "llama.cpp (GGUF Q4_K_M) - Kernels AVX2/AVX-512 nativos, más rápido en CPU",
     },
 }
 
 
-class LocalLLMProvider:
+def extract_json_object(text: str) -> str:
+    """Return the first balanced {...} object in a model response.
+
+    Skips any prose or markdown fences around the object. Braces inside JSON
+    strings are ignored. If the object is never closed, everything from its
+    first brace is returned so the parser reports the actual error.
+    """
+    start = text.find("{")
+    if start == -1:
+        return text
+
+    depth = 0
+    in_string = False
+    escape = False
+    for idx in range(start, len(text)):
+        char = text[idx]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:idx + 1]
+
+    return text[start:]
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """Check whether an exception means an allocation failed."""
+    if isinstance(error, MemoryError):
+        return True
+    # PyTorch reports failed CPU allocations as RuntimeError ("can't allocate memory")
+    return isinstance(error, RuntimeError) and "memory" in str(error).lower()
+
+
+def cpu_supports_bf16() -> bool:
+    """Check whether the CPU has native BF16 dot-product instructions."""
+    probe = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+    if probe is not None:
+        try:
+            return bool(probe())
+        except Exception:
+            pass
+
+    # Fall back to the kernel-reported CPU flags (Linux only)
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = f.read()
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    except OSError:
+        return False
+
+
+def cpu_supports_vnni() -> bool:
+    """Check whether the CPU has VNNI (INT8 dot-product) instructions."""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = f.read()
+        return "avx512_vnni" in flags or "avx_vnni" in flags
+    except OSError:
+        return False
+
+
+def quantized_cache_kwargs() -> Dict[str, Any]:
+    """Build generate() kwargs for a 4-bit quantized KV cache, if supported.
+
+    The default cache keeps K/V in the model dtype, so for long generations the
+    cache dominates per-token memory traffic. Quantizing it to 4 bits shrinks
+    it 4-8x. Requires either the HQQ or the optimum-quanto package.
+    """
+    try:
+        if importlib.util.find_spec("hqq") is not None:
+            print("Caché KV: 4 bits (HQQ)")
+            return {
+                "cache_implementation": "quantized",
+                "cache_config": {"backend": "HQQ", "nbits": 4, "axis_key": 0, "axis_value": 0},
+            }
+        if importlib.util.find_spec("optimum.quanto") is not None:
+            print("Caché KV: 4 bits (quanto)")
+            return {
+                "cache_implementation": "quantized",
+                "cache_config": {"backend": "quanto", "nbits": 4},
+            }
+    except ModuleNotFoundError:
+        pass
+
+    return {}
+
+
+class JsonBraceStop:
+    """Stopping criterion that ends generation once the top-level JSON object closes.
+
+    Tracks brace depth per sequence (ignoring braces inside strings), so each
+    row of a batch stops as soon as its response is complete instead of
+    running until the token budget or an end-of-sequence token. Streaming
+    backends feed their text chunks to it directly (see LlamaCppProvider).
+    """
+
+    def __init__(self, tokenizer, batch_size: int):
+        self.tokenizer = tokenizer
+        self.depth = [0] * batch_size
+        self.in_string = [False] * batch_size
+        self.escape = [False] * batch_size
+        self.closed = [False] * batch_size
+
+    def __call__(self, input_ids, scores, **kwargs):
+        for row, token_id in enumerate(input_ids[:, -1].tolist()):
+            if not self.closed[row]:
+                self.feed(row, self.tokenizer.decode([token_id]))
+        return torch.tensor(self.closed, dtype=torch.bool, device=input_ids.device)
+
+    def feed(self, row: int, text: str):
+        """Update the JSON scanner state of one sequence with newly generated text."""
+        for char in text:
+            if self.escape[row]:
+                self.escape[row] = False
+            elif self.in_string[row]:
+                if char == "\\":
+                    self.escape[row] = True
+                elif char == '"':
+                    self.in_string[row] = False
+            elif char == '"':
+                self.in_string[row] = True
+            elif char == "{":
+                self.depth[row] += 1
+            elif char == "}" and self.depth[row] > 0:
+                self.depth[row] -= 1
+                if self.depth[row] == 0:
+                    self.closed[row] = True
+                    return
+
+
+class BaseLLMProvider:
+    """Common batch interface shared by the local LLM providers."""
+
+    backend = None  # Key of AVAILABLE_BACKENDS, part of the response cache key
+
+    def generate_response(self, prompt: str) -> Optional[str]:
+        """Generate a response for a single prompt."""
+        return self.generate_responses([prompt])[0]
+
+    def generate_responses(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate responses for a batch of prompts."""
+        raise NotImplementedError
+
+    def generate_batches(self, prompt_batches: Iterable[List[str]]) -> Iterator[List[Optional[str]]]:
+        """Yield the responses of each prompt batch, in order.
+
+        The next batch is generated in a background thread while the caller
+        parses and saves the current one, so the model is never left idle
+        waiting on disk writes (PyTorch, ONNX Runtime and llama.cpp all
+        release the GIL while computing).
+        """
+        batches = iter(prompt_batches)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            prompts = next(batches, None)
+            future = executor.submit(self._generate_batch, prompts) if prompts is not None else None
+            while future is not None:
+                responses = future.result()
+                prompts = next(batches, None)
+                future = executor.submit(self._generate_batch, prompts) if prompts is not None else None
+                yield responses
+
+    def _generate_batch(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate one batch, yielding None per prompt if it fails.
+
+        One bad batch must not stop the rest of the run.
+        """
+        if not prompts:
+            return []
+        try:
+            return self.generate_responses(prompts)
+        except Exception as e:
+            print(f"Error enriching batch: {e}")
+            return [None] * len(prompts)
+
+    def close(self, terminate: bool = False):
+        """Release resources held by the provider.
+
+        With terminate=True (on interrupt) work still queued is abandoned
+        instead of waited for.
+        """
+
+
+class LocalLLMProvider(BaseLLMProvider):
     """Local LLM provider using Hugging Face transformers (optimized for CPU)."""
 
-    def __init__(self, model_id: str, model_name: str):
+    backend = "transformers"
+
+    def __init__(self, model_id: str, model_name: str, quantization: Optional[str] = None):
         """Initialize the local LLM provider."""
         self.model_id = model_id
         self.model_name = model_name
-        self.pipeline = None
+        self.quantization = quantization
+        self.dtype = None
+        self.ipex_optimized = False
+        self.json_enforcer_factory = None
+        self.cache_kwargs = {}
+        self.prefix_text = None
+        self.prefix_ids = None
+        self.prefix_kv = None
+        self.tokenizer = None
+        self.model = None
+        self.max_batch_size = BATCH_SIZE  # Lowered on out-of-memory, see generate_responses
+        self._batch_successes = 0
 
         print(f"\n{'='*60}")
         print(f"Inicializando modelo local: {model_name}")
         print(f"{'='*60}\n")
 
         try:
-            from transformers import pipeline, AutoTokenizer
-            import torch
+            # One intra-op thread per physical core, no inter-op parallelism
+            torch.set_num_threads(PHYSICAL_CORES)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass  # Can only be set before any inter-op work has started
+
+            # Let SDPA and matmuls dispatch to oneDNN's fused CPU kernels
+            torch.backends.mkldnn.enabled = True
+            if hasattr(torch.backends.mkldnn, "allow_tf32"):
+                torch.backends.mkldnn.allow_tf32 = True
 
             # Check if running on CPU
             device = "cpu"
@@ -87,30 +553,57 @@ class LocalLLMProvider:
             os.makedirs(MODELS_DIR, exist_ok=True)
 
             # Load tokenizer first to check if model exists
-            tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
                 model_id,
                 cache_dir=MODELS_DIR,
-                trust_remote_code=True
             )
             
             # Set pad token if not exists
             if tokenizer.pad_token is None:
                 tokenizer.pad_token = tokenizer.eos_token
 
-            # Create text generation pipeline with CPU optimizations
-            self.pipeline = pipeline(
-                "text-generation",
-                model=model_id,
-                tokenizer=tokenizer,
-                device=device,
-                torch_dtype=torch.float32,  # Use float32 for CPU
-                trust_remote_code=True,
-                model_kwargs={
-                    "low_cpu_mem_usage": True,  # Optimize memory usage
-                    "cache_dir": MODELS_DIR,  # Move cache_dir to model_kwargs
-                    "max_position_embeddings": 4096,  # Increase max sequence length
-                }
-            )
+            # Decoder-only models must be left-padded for batched generation
+            tokenizer.padding_side = "left"
+
+            # Constrain decoding to ENRICHED_DATA_SCHEMA when lm-format-enforcer is installed
+            try:
+                from lmformatenforcer import JsonSchemaParser
+                from lmformatenforcer.integrations.transformers import (
+                    build_token_enforcer_tokenizer_data,
+                    build_transformers_prefix_allowed_tokens_fn,
+                )
+
+                enforcer_data = build_token_enforcer_tokenizer_data(tokenizer)
+
+                # The parser tracks the state of each sequence, so every generate() needs a new one
+                self.json_enforcer_factory = lambda: build_transformers_prefix_allowed_tokens_fn(
+                    enforcer_data, JsonSchemaParser(ENRICHED_DATA_SCHEMA)
+                )
+                print("Decodificación restringida al esquema JSON (lm-format-enforcer)")
+            except ImportError:
+                pass
+
+            self.tokenizer = tokenizer
+
+            # Load the model weights (quantized when the model declares a scheme);
+            # generate() is called on the model directly, without a pipeline
+            model = self._load_model(model_id)
+            self.model = model
+
+            if isinstance(model, torch.nn.Module):
+                # IPEX already replaces the decoder with fused kernels in BF16 mode
+                if not self.ipex_optimized:
+                    self._compile_model(model)
+
+                # Store the KV cache in 4 bits when a quantization backend is installed
+                self.cache_kwargs = quantized_cache_kwargs()
+
+                # Prefill the shared prompt prefix once for all exercises
+                try:
+                    self._build_prefix_cache()
+                except Exception as e:
+                    print(f"⚠️  No se pudo precalcular el prefijo del prompt: {e}")
+                    self.prefix_kv = None
 
             print(f"✓ Modelo cargado exitosamente!\n")
 
@@ -123,187 +616,1181 @@ class LocalLLMProvider:
             print(f"\nIntenta con un modelo más pequeño o verifica tu conexión a internet.")
             sys.exit(1)
 
-    def generate_response(self, prompt: str) -> Optional[str]:
-        """Generate a response using the local LLM."""
+    def _load_model(self, model_id: str):
+        """Load the causal LM, applying weight quantization for CPU inference.
+
+        LLM decoding on CPU is memory-bound, so shrinking the weights from
+        FP32 to INT8 (4x) or INT4 (8x) directly cuts the bytes moved per token.
+        """
+        if self.quantization == "int4":
+            try:
+                return self._load_openvino_int4_model(model_id)
+            except ImportError:
+                print("⚠️  optimum[openvino] no está instalado, usando BF16/INT8 en su lugar")
+            except Exception as e:
+                print(f"⚠️  No se pudo cuantizar a INT4 con OpenVINO ({e}), usando BF16/INT8 en su lugar")
+
+        if self.quantization == "int8" and cpu_supports_vnni():
+            try:
+                return self._load_onnx_int8_model(model_id)
+            except ImportError:
+                pass
+            except Exception as e:
+                print(f"⚠️  No se pudo cuantizar a INT8 con ONNX Runtime ({e}), usando PyTorch en su lugar")
+
+        # Native BF16 halves weight traffic vs FP32 without quantization error;
+        # dynamic INT8 quantization needs FP32 weights, so it is the fallback
+        # for CPUs without BF16 dot-product instructions.
+        if cpu_supports_bf16():
+            self.dtype = torch.bfloat16
+        else:
+            self.dtype = torch.float32
+
+        model = transformers.AutoModelForCausalLM.from_pretrained(
+            model_id,
+            torch_dtype=self.dtype,
+            low_cpu_mem_usage=True,  # Optimize memory usage
+            attn_implementation="sdpa",  # Fused attention, no materialized seq² score matrix
+            cache_dir=MODELS_DIR,
+            max_position_embeddings=4096,  # Increase max sequence length
+        )
+        model.eval()
+
+        if self.dtype == torch.bfloat16:
+            print("Precisión: BF16 (AVX-512 BF16 / AMX detectado)")
+            try:
+                import intel_extension_for_pytorch as ipex
+
+                model = ipex.llm.optimize(model, dtype=torch.bfloat16)
+                self.ipex_optimized = True
+                print("Optimizado con Intel Extension for PyTorch")
+            except ImportError:
+                pass
+        elif self.quantization in ("int8", "int4"):
+            # Quantize every nn.Linear to INT8 weights (VNNI-backed GEMMs on x86)
+            print("Cuantización: INT8 dinámica (nn.Linear)")
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        else:
+            print("Cuantización: ninguna (FP32)")
+
+        return model
+
+    def _load_openvino_int4_model(self, model_id: str):
+        """Load the model in OpenVINO with INT4 weight-only quantization.
+
+        The model is exported and its weights quantized to INT4 once; later
+        runs load the quantized copy from MODELS_DIR.
+        """
+        from optimum.intel import OVModelForCausalLM, OVWeightQuantizationConfig
+
+        save_dir = os.path.join(MODELS_DIR, "openvino-int4", model_id.replace("/", "--"))
+
+        if not os.path.exists(os.path.join(save_dir, "openvino_model.xml")):
+            print("Exportando a OpenVINO y cuantizando a INT4 (solo la primera vez)...")
+            exported = OVModelForCausalLM.from_pretrained(
+                model_id,
+                export=True,
+                quantization_config=OVWeightQuantizationConfig(bits=4),
+                cache_dir=MODELS_DIR,
+            )
+            exported.save_pretrained(save_dir)
+            model = exported
+        else:
+            model = OVModelForCausalLM.from_pretrained(save_dir)
+
+        print("Cuantización: INT4 (OpenVINO, solo pesos)")
+        return model
+
+    def _load_onnx_int8_model(self, model_id: str):
+        """Load the model in ONNX Runtime with INT8 dynamic quantization.
+
+        The model is exported to ONNX and every MatMul quantized to INT8 once;
+        later runs load the quantized copy from MODELS_DIR. INT8 GEMMs only pay
+        off on CPUs with VNNI instructions, so callers check for it first.
+        """
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        save_dir = os.path.join(MODELS_DIR, "onnx-int8", model_id.replace("/", "--"))
+        quantized_file = "model_quantized.onnx"
+
+        if not os.path.exists(os.path.join(save_dir, quantized_file)):
+            print("Exportando a ONNX y cuantizando a INT8 (solo la primera vez)...")
+            exported = ORTModelForCausalLM.from_pretrained(model_id, export=True, cache_dir=MODELS_DIR)
+            quantizer = ORTQuantizer.from_pretrained(exported)
+            quantizer.quantize(
+                save_dir=save_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True),
+            )
+            exported.config.save_pretrained(save_dir)
+            exported.generation_config.save_pretrained(save_dir)
+
+        # One intra-op thread per physical core, as for PyTorch
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = PHYSICAL_CORES
+        session_options.inter_op_num_threads = 1
+
+        print("Cuantización: INT8 dinámica (ONNX Runtime, VNNI)")
+        return ORTModelForCausalLM.from_pretrained(
+            save_dir,
+            file_name=quantized_file,
+            session_options=session_options,
+        )
+
+    def _compile_model(self, model):
+        """Compile the forward pass with torch.compile and warm it up.
+
+        In eager mode every decode step dispatches hundreds of small ATen ops
+        from Python, which dominates at batch sizes this small on CPU.
+        """
+        eager_forward = model.forward
         try:
-            # Different chat templates for different models
-            if "Qwen" in self.model_id:
-                messages = [{"role": "user", "content": prompt}]
-                formatted_prompt = self.pipeline.tokenizer.apply_chat_template(
-                    messages,
-                    tokenize=False,
-                    add_generation_prompt=True
-                )
-            elif "Phi-3" in self.model_id:
-                formatted_prompt = f"<|user|>\n{prompt}<|end|>\n<|assistant|>\n"
-            elif "TinyLlama" in self.model_id:
-                formatted_prompt = f"<|user|>\n{prompt}</s>\n<|assistant|>\n"
-            else:
-                formatted_prompt = prompt
-
-            # Check if prompt is too long and truncate if necessary
-            max_prompt_length = 1800  # Leave room for generated tokens
-            tokens = self.pipeline.tokenizer.encode(formatted_prompt)
-            if len(tokens) > max_prompt_length:
-                # Truncate prompt to fit within limits
-                truncated_tokens = tokens[:max_prompt_length]
-                formatted_prompt = self.pipeline.tokenizer.decode(truncated_tokens, skip_special_tokens=True)
-                print(f"⚠️  Prompt truncated to fit model limits ({len(tokens)} -> {len(truncated_tokens)} tokens)")
-
-            # Generate response with reduced token count
-            outputs = self.pipeline(
-                formatted_prompt,
-                max_new_tokens=800,  # Reduced from 1200 to leave more room for prompt
-                do_sample=True,
-                temperature=0.5,  # Lower temperature for more focused responses
-                top_p=0.9,
-                pad_token_id=self.pipeline.tokenizer.eos_token_id,
-                eos_token_id=self.pipeline.tokenizer.eos_token_id,
-                truncation=True,  # Enable truncation
+            model.forward = torch.compile(model.forward, dynamic=True)
+
+            # Compilation is lazy: run a short generation so the graphs are
+            # built (and any unsupported op is detected) before the real work
+            tokenizer = self.tokenizer
+            inputs = tokenizer(self._format_prompt("warmup"), return_tensors="pt")
+            with torch.inference_mode(), torch.autocast(
+                "cpu", dtype=torch.bfloat16, enabled=self.dtype == torch.bfloat16
+            ):
+                model.generate(**inputs, max_new_tokens=4, pad_token_id=tokenizer.pad_token_id)
+
+            print("Modelo compilado con torch.compile")
+        except Exception as e:
+            model.forward = eager_forward
+            print(f"⚠️  torch.compile no disponible, usando modo eager: {e}")
+
+    def _format_prompt(self, prompt: str) -> str:
+        """Wrap a prompt in the model's chat template."""
+        # Different chat templates for different models
+        if "Qwen" in self.model_id:
+            messages = [{"role": "user", "content": prompt}]
+            formatted_prompt = self.tokenizer.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+        elif "Phi-3" in self.model_id:
+            formatted_prompt = f"<|user|>\n{prompt}<|end|>\n<|assistant|>\n"
+        elif "TinyLlama" in self.model_id:
+            formatted_prompt = f"<|user|>\n{prompt}</s>\n<|assistant|>\n"
+        else:
+            formatted_prompt = prompt
+
+        return formatted_prompt
+
+    def _build_prefix_cache(self):
+        """Prefill the static prompt prefix once and keep its KV cache.
+
+        Every prompt starts with STATIC_PROMPT_PREFIX, so its keys/values are
+        the same for all exercises. Computing them once means generation only
+        has to prefill the per-exercise part of each prompt.
+        """
+        tokenizer = self.tokenizer
+        formatted = self._format_prompt(STATIC_PROMPT_PREFIX + PROMPT_SPLIT_MARKER)
+        self.prefix_text = formatted.split(PROMPT_SPLIT_MARKER)[0]
+        self.prefix_ids = tokenizer(self.prefix_text, return_tensors="pt")["input_ids"]
+
+        with torch.inference_mode(), torch.autocast(
+            "cpu", dtype=torch.bfloat16, enabled=self.dtype == torch.bfloat16
+        ):
+            # Without a cache object, older transformers return a legacy tuple that
+            # cannot be repeated across a batch
+            outputs = self.model(
+                input_ids=self.prefix_ids,
+                past_key_values=transformers.DynamicCache(),
+                use_cache=True,
             )
 
-            # Extract generated text
-            generated_text = outputs[0]["generated_text"]
+        prefix_kv = outputs.past_key_values
+        if isinstance(prefix_kv, tuple):
+            prefix_kv = transformers.DynamicCache.from_legacy_cache(prefix_kv)
+        self.prefix_kv = prefix_kv
+        print(f"Prefijo del prompt precalculado ({self.prefix_ids.shape[1]} tokens)")
+
+    def _prefixed_inputs(self, formatted_prompts: List[str]) -> Optional[Dict[str, Any]]:
+        """Build generate() inputs that reuse the precomputed prefix KV cache.
+
+        Returns None when the cache cannot be expanded to the batch, so the
+        caller tokenizes the full prompts instead.
+        """
+        tokenizer = self.tokenizer
+        prefix = self.prefix_ids[0].tolist()
+
+        # Tokenize and truncate the suffixes in a single pass
+        suffixes = tokenizer(
+            [prompt[len(self.prefix_text):] for prompt in formatted_prompts],
+            add_special_tokens=False,
+            truncation=True,
+            max_length=MAX_PROMPT_TOKENS - len(prefix),
+        )["input_ids"]
+        self._warn_truncated(len(prefix) + len(ids) for ids in suffixes)
+        longest = max(len(ids) for ids in suffixes)
+
+        input_ids = []
+        attention_mask = []
+        for ids in suffixes:
+            # Pad between prefix and suffix so the cached prefix keeps its positions
+            padding = longest - len(ids)
+            input_ids.append(prefix + [tokenizer.pad_token_id] * padding + ids)
+            attention_mask.append([1] * len(prefix) + [0] * padding + [1] * len(ids))
+
+        past_key_values = copy.deepcopy(self.prefix_kv)
+        if len(formatted_prompts) > 1:
+            try:
+                past_key_values.batch_repeat_interleave(len(formatted_prompts))
+            except Exception as e:
+                # Don't retry (and warn) on every batch
+                print(f"⚠️  No se pudo reutilizar el prefijo del prompt, se procesa completo: {e}")
+                self.prefix_kv = None
+                return None
 
-            # Remove the prompt from the response
-            if generated_text.startswith(formatted_prompt):
-                response = generated_text[len(formatted_prompt):].strip()
-            else:
-                response = generated_text.strip()
+        return {
+            "input_ids": torch.tensor(input_ids),
+            "attention_mask": torch.tensor(attention_mask),
+            "past_key_values": past_key_values,
+        }
+
+    @staticmethod
+    def _warn_truncated(prompt_lengths):
+        """Warn when a tokenized prompt was cut at the context limit."""
+        if any(length >= MAX_PROMPT_TOKENS for length in prompt_lengths):
+            print(f"⚠️  Prompt truncated to fit model limits ({MAX_PROMPT_TOKENS} tokens)")
+
+    def generate_responses(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate responses for a batch of prompts, adapting the batch size to memory.
+
+        The prompts are generated in chunks of at most max_batch_size. When a
+        chunk runs out of memory, the size is halved and the chunk retried;
+        after BATCH_GROW_AFTER successful chunks it grows back by one, up to
+        the size of the requested batch.
+        """
+        responses = []
+        while len(responses) < len(prompts):
+            chunk = prompts[len(responses):len(responses) + self.max_batch_size]
+            try:
+                responses.extend(self._generate_chunk(chunk))
+            except (MemoryError, RuntimeError) as e:
+                if len(chunk) == 1 or not is_out_of_memory(e):
+                    raise Exception(f"Error generando respuesta del modelo local: {e}")
+                self.max_batch_size = len(chunk) // 2
+                self._batch_successes = 0
+                print(f"⚠️  Out of memory with {len(chunk)} prompts, batch size lowered to {self.max_batch_size}")
+                continue
+
+            self._batch_successes += 1
+            if self._batch_successes >= BATCH_GROW_AFTER and self.max_batch_size < len(prompts):
+                self.max_batch_size += 1
+                self._batch_successes = 0
+                print(f"Batch size raised to {self.max_batch_size}")
+
+        return responses
 
-            # For Phi-3, remove the end token if present
-            if "<|end|>" in response:
-                response = response.split("<|end|>")[0].strip()
+    def _generate_chunk(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate responses for a batch of prompts in a single generate() call.
 
-            return response
+        Batching amortizes each read of the weights across all prompts in the
+        batch, which is what bounds decode speed on CPU.
+        """
+        try:
+            formatted_prompts = [self._format_prompt(prompt) for prompt in prompts]
+
+            # Generate response with reduced token count (BF16 matmuls accumulate in FP32)
+            tokenizer = self.tokenizer
+            inputs = None
+            if self.prefix_kv is not None and all(
+                prompt.startswith(self.prefix_text) for prompt in formatted_prompts
+            ):
+                # generate() accepts either a prebuilt cache or a cache implementation,
+                # so the prefix cache takes the place of the quantized KV cache
+                inputs = self._prefixed_inputs(formatted_prompts)
+                generate_kwargs = {}
+            if inputs is None:
+                inputs = tokenizer(
+                    formatted_prompts,
+                    padding=True,
+                    truncation=True,
+                    max_length=MAX_PROMPT_TOKENS,
+                    return_tensors="pt",
+                )
+                self._warn_truncated([inputs["attention_mask"].sum(dim=1).max().item()])
+                generate_kwargs = dict(self.cache_kwargs)
+
+            # Only tokens that keep the output valid against the schema can be sampled,
+            # so no tokens are wasted on prose or markdown and every response parses
+            if self.json_enforcer_factory is not None:
+                generate_kwargs["prefix_allowed_tokens_fn"] = self.json_enforcer_factory()
+
+            with torch.inference_mode(), torch.autocast(
+                "cpu", dtype=torch.bfloat16, enabled=self.dtype == torch.bfloat16
+            ):
+                output_ids = self.model.generate(
+                    **inputs,
+                    max_new_tokens=MAX_NEW_TOKENS,
+                    do_sample=False,  # Greedy decoding: no top-p sort over the vocabulary per step
+                    num_beams=1,
+                    stop_strings=GENERATION_STOP_STRINGS,
+                    tokenizer=tokenizer,  # Required by generate() to match stop_strings
+                    stopping_criteria=transformers.StoppingCriteriaList([JsonBraceStop(tokenizer, len(prompts))]),
+                    pad_token_id=tokenizer.pad_token_id,
+                    eos_token_id=tokenizer.eos_token_id,
+                    # Only the token IDs are needed: never keep per-step logits or activations
+                    return_dict_in_generate=False,
+                    output_scores=False,
+                    output_logits=False,
+                    output_attentions=False,
+                    output_hidden_states=False,
+                    **generate_kwargs,
+                )
+
+            # Decode only the newly generated tokens (prompts are padded to the same length)
+            prompt_length = inputs["input_ids"].shape[1]
+            responses = []
+            for row in output_ids:
+                response = tokenizer.decode(row[prompt_length:], skip_special_tokens=True).strip()
+
+                # For Phi-3, remove the end token if present
+                if "<|end|>" in response:
+                    response = response.split("<|end|>")[0].strip()
 
+                responses.append(response)
+
+            return responses
+
+        except (MemoryError, RuntimeError):
+            raise  # Handled by generate_responses
         except Exception as e:
             raise Exception(f"Error generando respuesta del modelo local: {e}")
 
 
+class LlamaCppProvider(BaseLLMProvider):
+    """Local LLM provider using llama.cpp with INT4 GGUF weights (optimized for CPU)."""
+
+    backend = "llama.cpp"
+
+    def __init__(self, gguf_repo: str, gguf_file: str, model_name: str):
+        """Initialize the llama.cpp provider."""
+        self.gguf_repo = gguf_repo
+        self.gguf_file = gguf_file
+        self.model_name = model_name
+        self.llm = None
+
+        print(f"\n{'='*60}")
+        print(f"Inicializando modelo local (llama.cpp): {model_name}")
+        print(f"{'='*60}\n")
+
+        try:
+            from llama_cpp import Llama
+
+            print(f"Modelo GGUF: {gguf_repo} ({gguf_file})")
+            print("Descargando/cargando modelo (esto puede tardar la primera vez)...\n")
+
+            # Create cache directory if it doesn't exist
+            os.makedirs(MODELS_DIR, exist_ok=True)
+
+            # Downloads through huggingface_hub and memory-maps the GGUF file
+            self.llm = Llama.from_pretrained(
+                repo_id=gguf_repo,
+                filename=gguf_file,
+                cache_dir=MODELS_DIR,
+                n_ctx=4096,
+                n_threads=PHYSICAL_CORES,
+                n_batch=512,
+                logits_all=False,
+                use_mmap=True,
+                use_mlock=False,
+                verbose=False,
+            )
+
+            print(f"✓ Modelo cargado exitosamente!\n")
+
+        except ImportError as e:
+            print(f"Error: Falta instalar llama-cpp-python")
+            print(f"Ejecuta: pip install llama-cpp-python")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error al cargar el modelo: {e}")
+            print(f"\nIntenta con un modelo más pequeño o verifica tu conexión a internet.")
+            sys.exit(1)
+
+    def generate_response(self, prompt: str) -> Optional[str]:
+        """Generate a response using llama.cpp.
+
+        The completion is streamed and cut off as soon as the top-level JSON
+        object closes, so no tokens are spent on trailing whitespace.
+        """
+        try:
+            # llama.cpp applies the chat template stored in the GGUF metadata
+            stream = self.llm.create_chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=MAX_NEW_TOKENS,
+                temperature=GENERATION_TEMPERATURE,
+                stop=GENERATION_STOP_STRINGS,
+                # Grammar-constrained decoding straight from the JSON schema
+                response_format={"type": "json_object", "schema": ENRICHED_DATA_SCHEMA},
+                stream=True,
+            )
+
+            brace_stop = JsonBraceStop(None, 1)
+            parts = []
+            try:
+                for chunk in stream:
+                    text = chunk["choices"][0]["delta"].get("content")
+                    if not text:
+                        continue
+                    parts.append(text)
+                    brace_stop.feed(0, text)
+                    if brace_stop.closed[0]:
+                        break
+            finally:
+                # Closing the generator stops llama.cpp from decoding further tokens
+                stream.close()
+
+            return "".join(parts).strip()
+
+        except Exception as e:
+            raise Exception(f"Error generando respuesta del modelo llama.cpp: {e}")
+
+    def generate_responses(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate responses for a batch of prompts (sequentially in llama.cpp)."""
+        return [self.generate_response(prompt) for prompt in prompts]
+
+
+# Provider of the current replica worker process (see ReplicaPoolProvider)
+replica_provider = None
+
+
+def init_replica_worker(
+    model_id: str, model_name: str, quantization: Optional[str], backend: str, core_sets
+):
+    """Pin a replica worker to its cores and load its own copy of the model."""
+    global PHYSICAL_CORES, replica_provider
+
+    cores, threads = core_sets.get()
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    # Each replica only uses its own cores (read by configure_threading and llama.cpp)
+    PHYSICAL_CORES = threads
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+
+    try:
+        replica_provider = create_local_provider(model_id, model_name, quantization, backend)
+    except BaseException as e:
+        # A failing initializer would break the whole executor; leave the
+        # worker alive so only its tasks report the failure
+        print(f"Error al cargar el modelo en la réplica: {e}")
+        replica_provider = None
+
+
+def generate_in_replica(prompts: List[str]) -> List[Optional[str]]:
+    """Generate a batch of responses with the replica of the current worker."""
+    if not prompts:
+        return []
+    if replica_provider is None:
+        raise Exception("La réplica no pudo cargar el modelo")
+    return replica_provider.generate_responses(prompts)
+
+
+def numa_node_cpus() -> List[List[int]]:
+    """List the CPUs of each NUMA node (a single node on non-NUMA systems)."""
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        with open(path, "r", encoding="utf-8") as f:
+            cpus = []
+            for part in f.read().strip().split(","):
+                if "-" in part:
+                    first, last = part.split("-")
+                    cpus.extend(range(int(first), int(last) + 1))
+                elif part:
+                    cpus.append(int(part))
+        nodes.append(cpus)
+
+    if not nodes:
+        nodes.append(sorted(os.sched_getaffinity(0)))
+    return nodes
+
+
+def replica_core_sets(replicas: int) -> List[tuple[List[int], int]]:
+    """Split the physical cores into disjoint (cpus, threads) sets, one per replica.
+
+    Sets never span NUMA nodes, so each replica reads its weights from local
+    memory. Without CPU affinity support (Windows/macOS) replicas are not
+    pinned and just split the thread count.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        threads = max(1, PHYSICAL_CORES // replicas)
+        return [([], threads)] * replicas
+
+    allowed = os.sched_getaffinity(0)
+    threads_per_core = max(1, len(allowed) // PHYSICAL_CORES)
+
+    nodes = []
+    for cpus in numa_node_cpus():
+        cpus = [cpu for cpu in cpus if cpu in allowed]
+        # Linux numbers hyper-thread siblings after all physical cores
+        cpus = cpus[:max(1, len(cpus) // threads_per_core)]
+        if cpus:
+            nodes.append(cpus)
+
+    per_node = max(1, math.ceil(replicas / len(nodes)))
+    core_sets = []
+    for cpus in nodes:
+        size = max(1, math.ceil(len(cpus) / per_node))
+        core_sets.extend((cpus[i:i + size], len(cpus[i:i + size])) for i in range(0, len(cpus), size))
+    return core_sets[:replicas]
+
+
+def default_replica_count() -> int:
+    """Pick how many model replicas to run: one per NUMA node, or per CORES_PER_REPLICA cores.
+
+    Small models stop scaling well past ~16 threads, so big machines get more
+    throughput from several independent replicas than from one wide one.
+    """
+    nodes = len(glob.glob("/sys/devices/system/node/node[0-9]*"))
+    return max(1, nodes, math.ceil(PHYSICAL_CORES / CORES_PER_REPLICA))
+
+
+def select_replica_count() -> int:
+    """Return the number of model replicas (ENRICHER_REPLICAS, or the default for this machine)."""
+    value = os.environ.get("ENRICHER_REPLICAS", "").strip()
+    if value:
+        if value.isdigit() and int(value) >= 1:
+            print(f"Usando ENRICHER_REPLICAS={value}")
+            return int(value)
+        print(f"⚠️  ENRICHER_REPLICAS={value} no es válido (debe ser un entero mayor que 0)")
+    return default_replica_count()
+
+
+class ReplicaPoolProvider(BaseLLMProvider):
+    """Runs several model replicas in worker processes, each pinned to its own cores."""
+
+    def __init__(
+        self,
+        model_id: str,
+        model_name: str,
+        quantization: Optional[str],
+        backend: str,
+        replicas: int,
+    ):
+        """Start one worker process per replica."""
+        self.model_name = model_name
+        self.backend = backend
+
+        # There may be fewer core sets than requested replicas (e.g. small NUMA
+        # nodes); a worker without a core set would wait for one forever
+        replica_cores = replica_core_sets(replicas)
+        self.replicas = len(replica_cores)
+
+        print(f"\nIniciando {self.replicas} réplicas del modelo (una por grupo de núcleos)...")
+
+        context = multiprocessing.get_context("spawn")
+        core_sets = context.Queue()
+        for core_set in replica_cores:
+            core_sets.put(core_set)
+
+        # Unlike multiprocessing.Pool, the executor notices a dead worker (e.g.
+        # killed when out of memory) and fails its futures with BrokenProcessPool
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.replicas,
+            mp_context=context,
+            initializer=init_replica_worker,
+            initargs=(model_id, model_name, quantization, backend, core_sets),
+        )
+
+    def generate_responses(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate a batch of responses on one of the replicas."""
+        return self._result(self.executor.submit(generate_in_replica, prompts))
+
+    def generate_batches(self, prompt_batches: Iterable[List[str]]) -> Iterator[List[Optional[str]]]:
+        """Spread the batches over the replicas, yielding results in order.
+
+        At most one batch per replica is in flight, so the batches are pulled
+        from prompt_batches lazily and can depend on the results before them.
+        """
+        batches = iter(prompt_batches)
+        in_flight = deque()
+
+        def submit_next():
+            prompts = next(batches, None)
+            if prompts is not None:
+                in_flight.append((prompts, self.executor.submit(generate_in_replica, prompts)))
+
+        for _ in range(self.replicas):
+            submit_next()
+
+        while in_flight:
+            prompts, future = in_flight.popleft()
+            try:
+                responses = self._result(future)
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                print(f"Error enriching batch: {e}")
+                responses = [None] * len(prompts)
+            submit_next()
+            yield responses
+
+    @staticmethod
+    def _result(future) -> List[Optional[str]]:
+        """Wait for a replica's result, explaining a dead worker."""
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            raise BrokenProcessPool(
+                "Una réplica del modelo terminó inesperadamente (¿sin memoria?). "
+                "Prueba con menos réplicas (ENRICHER_REPLICAS)"
+            ) from e
+
+    def close(self, terminate: bool = False):
+        """Stop the worker processes.
+
+        On interrupt the workers are killed instead of letting them finish
+        the batches they are generating.
+        """
+        if terminate:
+            if hasattr(self.executor, "terminate_workers"):  # Python 3.14+
+                self.executor.terminate_workers()
+                return
+            # Older versions have no public way to stop running tasks
+            processes = list((self.executor._processes or {}).values())
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+        self.executor.shutdown(wait=True)
+
+
+class SemanticResponseCache:
+    """Reuse the responses of near-duplicate exercises, matched by embedding similarity.
+
+    Exercises such as "Barbell Bench Press" and "Bench Press with Barbell" get
+    the same enrichment, but their prompts differ, so the exact prompt cache
+    misses. Here only the exercise names are embedded, and a new exercise
+    reuses the closest cached response of an exercise with exactly the same
+    category and equipment when the cosine similarity reaches
+    SEMANTIC_CACHE_THRESHOLD. Requires sentence-transformers and faiss.
+    """
+
+    def __init__(self):
+        """Load the embedding model; an index is created per category and equipment."""
+        import faiss
+        from sentence_transformers import SentenceTransformer
+
+        self.faiss = faiss
+        self.encoder = SentenceTransformer(SEMANTIC_CACHE_MODEL, cache_folder=MODELS_DIR, device="cpu")
+        self.indexes: Dict[str, Any] = {}
+        self.responses: Dict[str, List[str]] = {}
+
+    def _embed(self, texts: List[str]):
+        """Embed texts as normalized float32 vectors."""
+        embeddings = self.encoder.encode(
+            [text.lower() for text in texts], normalize_embeddings=True, convert_to_numpy=True
+        )
+        return embeddings.astype("float32")
+
+    def add(self, texts: List[str], responses: List[str]):
+        """Index the responses of the given exercise texts."""
+        entries = [
+            (header, names, response)
+            for (header, names), response in zip(map(split_exercise_text, texts), responses)
+            if names
+        ]
+        if not entries:
+            return
+
+        embeddings = self._embed([names for _, names, _ in entries])
+        for row, (header, _, response) in enumerate(entries):
+            if header not in self.indexes:
+                # Inner product of normalized embeddings is the cosine similarity
+                self.indexes[header] = self.faiss.IndexFlatIP(self.encoder.get_sentence_embedding_dimension())
+                self.responses[header] = []
+            self.indexes[header].add(embeddings[row:row + 1])
+            self.responses[header].append(response)
+
+    def lookup(self, texts: List[str]) -> List[Optional[str]]:
+        """Return the closest cached response for each text, or None if none is close enough."""
+        results: List[Optional[str]] = [None] * len(texts)
+        queries = [
+            (idx, header, names)
+            for idx, (header, names) in enumerate(map(split_exercise_text, texts))
+            if names and header in self.indexes
+        ]
+        if not queries:
+            return results
+
+        embeddings = self._embed([names for _, _, names in queries])
+        for row, (idx, header, _) in enumerate(queries):
+            scores, ids = self.indexes[header].search(embeddings[row:row + 1], 1)
+            if scores[0][0] >= SEMANTIC_CACHE_THRESHOLD:
+                results[idx] = self.responses[header][ids[0][0]]
+        return results
+
+
+def exercise_text(prompt: str) -> Optional[str]:
+    """Return the per-exercise part of a prompt (category, equipment and names)."""
+    if not prompt.startswith(STATIC_PROMPT_PREFIX):
+        return None
+    return prompt[len(STATIC_PROMPT_PREFIX):]
+
+
+def split_exercise_text(text: str) -> Tuple[str, str]:
+    """Split the per-exercise part of a prompt into its category/equipment header and its names.
+
+    The header and the "- Name (lang N):" labels are shared by most exercises,
+    so only the names themselves are worth comparing by similarity.
+    """
+    header, _, existing_info = text.partition("\n\n")
+    names = [
+        line.split("): ", 1)[1]
+        for line in existing_info.splitlines()
+        if line.startswith("- Name (") and "): " in line
+    ]
+    return header, "\n".join(names)
+
+
+def create_semantic_cache() -> Optional[SemanticResponseCache]:
+    """Create the semantic cache when enabled with ENRICHER_SEMANTIC_CACHE=1 and installed."""
+    if os.environ.get("ENRICHER_SEMANTIC_CACHE", "").strip().lower() not in ("1", "true", "yes"):
+        return None
+
+    try:
+        semantic_cache = SemanticResponseCache()
+        print(f"Caché semántica activada ({SEMANTIC_CACHE_MODEL}, similitud >= {SEMANTIC_CACHE_THRESHOLD})")
+        return semantic_cache
+    except ImportError:
+        print("⚠️  Caché semántica no disponible: instala sentence-transformers y faiss-cpu")
+    except Exception as e:
+        print(f"⚠️  No se pudo cargar la caché semántica: {e}")
+    return None
+
+
 class ExerciseEnricher:
     """Class to handle the enrichment of exercises using AI."""
 
-    def __init__(self, provider: LocalLLMProvider, model_name: str):
+    def __init__(self, provider: BaseLLMProvider, model_name: str):
         """Initialize the enricher with local LLM provider."""
         self.provider = provider
         self.model_name = model_name
-        self.processed_ids = self._load_progress()
-        self.enriched_exercises = self._load_existing_output()
+        self._progress_bits = bytearray()
+        self._dirty_progress_bytes: Set[int] = set()
+        self._unflushed_progress = 0
+
+        # Create the output directories once, so the save paths never have to check
+        for path in (OUTPUT_FILE, OUTPUT_LOG_FILE, PROGRESS_FILE, PROGRESS_BITS_FILE, PROMPT_CACHE_FILE):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        output_ids = self._load_existing_output()
+        self._output_count = len(output_ids)
+        self.processed_ids = self._load_progress(output_ids)
+        self._semantic_cache = create_semantic_cache()
+        self._prompt_cache: Dict[str, str] = self._load_prompt_cache()
+
+        # Append-only logs stay open for the whole run: one write per record, no reopening
+        self._output_log = open_append_log(OUTPUT_LOG_FILE)
+        self._prompt_cache_log = open_append_log(PROMPT_CACHE_FILE)
+
+        # Progress is flushed in batches, so make sure the last batch reaches the disk
+        atexit.register(self.close)
+
+    def _load_progress(self, output_ids: List[int]) -> Set[int]:
+        """Load the set of already processed exercise IDs.
+
+        The bitmap file is synced every PROGRESS_FLUSH_INTERVAL exercises, so
+        the output log is merged in to recover the ones saved since. The JSON
+        progress summary (written on snapshots) is merged in too, so runs
+        saved by older versions of the script resume correctly.
+        """
+        processed_ids = set()
+        if os.path.exists(PROGRESS_BITS_FILE):
+            try:
+                with open(PROGRESS_BITS_FILE, "rb") as f:
+                    self._progress_bits = bytearray(f.read())
+                processed_ids.update(
+                    (byte_idx << 3) | bit
+                    for byte_idx, byte in enumerate(self._progress_bits)
+                    if byte
+                    for bit in range(8)
+                    if byte >> bit & 1
+                )
+            except Exception as e:
+                print(f"Warning: Could not load progress bitmap: {e}")
 
-    def _load_progress(self) -> List[int]:
-        """Load the list of already processed exercise IDs."""
         if os.path.exists(PROGRESS_FILE):
             try:
-                with open(PROGRESS_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    return data.get("processed_exercise_ids", [])
+                with open(PROGRESS_FILE, "rb") as f:
+                    data = json_loads(f.read())
+                    processed_ids.update(data.get("processed_exercise_ids", []))
             except Exception as e:
                 print(f"Warning: Could not load progress file: {e}")
-        return []
+
+        processed_ids.update(output_ids)
+        return processed_ids
 
     def _save_progress(self, exercise_id: int):
-        """Save progress after processing an exercise."""
-        if exercise_id not in self.processed_ids:
-            self.processed_ids.append(exercise_id)
+        """Mark an exercise as processed by flipping its bit in the progress bitmap.
+
+        The bitmap is synced to disk every PROGRESS_FLUSH_INTERVAL exercises.
+        Exercises saved since the last flush are still recorded in the output
+        log, which _load_progress merges in. An exercise whose log line was cut
+        short by a crash is not marked anywhere, so the next run retries it.
+        """
+        self.processed_ids.add(exercise_id)
+
+        # The bitmap can only hold non-negative integer IDs; others are still
+        # tracked through the output log and the JSON progress summary
+        if not isinstance(exercise_id, int) or isinstance(exercise_id, bool) or exercise_id < 0:
+            print(f"Warning: Exercise ID {exercise_id!r} cannot be stored in the progress bitmap")
+            return
 
-        progress_data = {
-            "processed_exercise_ids": self.processed_ids,
-            "last_updated": datetime.now().isoformat(),
-            "total_processed": len(self.processed_ids),
-            "model": self.model_name,
-        }
+        byte_idx = exercise_id >> 3
+        if byte_idx >= len(self._progress_bits):
+            self._progress_bits.extend(bytes(byte_idx + 1 - len(self._progress_bits)))
+        self._progress_bits[byte_idx] |= 1 << (exercise_id & 7)
+        self._dirty_progress_bytes.add(byte_idx)
 
-        try:
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(PROGRESS_FILE), exist_ok=True)
+        self._unflushed_progress += 1
+        if self._unflushed_progress >= PROGRESS_FLUSH_INTERVAL:
+            self._flush_progress()
+
+    def _flush_progress(self):
+        """Write the changed bytes of the progress bitmap and sync them to disk.
+
+        Only the bytes holding newly set bits are rewritten, so each flush is
+        independent of how many exercises are already done.
+        """
+        if not self._dirty_progress_bytes:
+            return
 
-            with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
-                json.dump(progress_data, f, indent=2, ensure_ascii=False)
+        try:
+            mode = "r+b" if os.path.exists(PROGRESS_BITS_FILE) else "w+b"
+            with open(PROGRESS_BITS_FILE, mode) as f:
+                for byte_idx in sorted(self._dirty_progress_bytes):
+                    f.seek(byte_idx)
+                    f.write(bytes([self._progress_bits[byte_idx]]))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._dirty_progress_bytes.clear()
+            self._unflushed_progress = 0
         except Exception as e:
             print(f"Error saving progress: {e}")
 
-    def _load_existing_output(self) -> List[Dict[str, Any]]:
-        """Load existing enriched exercises if the output file exists."""
+    def _load_existing_output(self) -> List[int]:
+        """Load the IDs of existing enriched exercises from the output log (or legacy JSON file).
+
+        Only the IDs are kept: the records themselves stay on disk and are
+        streamed from the log when a snapshot is written.
+        """
+        if os.path.exists(OUTPUT_LOG_FILE):
+            output_ids = []
+            try:
+                with open(OUTPUT_LOG_FILE, "rb") as f:
+                    for line_number, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            output_ids.append(json_loads(line).get("id"))
+                        except json.JSONDecodeError:
+                            # A run killed mid-write can leave a truncated last line
+                            print(f"Warning: Skipping invalid line {line_number} in {OUTPUT_LOG_FILE}")
+            except Exception as e:
+                print(f"Warning: Could not load existing output log: {e}")
+            return output_ids
+
         if os.path.exists(OUTPUT_FILE):
             try:
-                with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                with open(OUTPUT_FILE, "rb") as f:
+                    enriched_exercises = json_loads(f.read())
+
+                # Seed the append-only log so new results are added after the old ones
+                with open(OUTPUT_LOG_FILE, "wb") as f:
+                    for enriched_exercise in enriched_exercises:
+                        f.write(json_dumps(enriched_exercise, newline=True))
+                return [enriched_exercise.get("id") for enriched_exercise in enriched_exercises]
             except Exception as e:
                 print(f"Warning: Could not load existing output file: {e}")
         return []
 
-    def _save_enriched_exercise(self, enriched_exercise: Dict[str, Any]):
-        """Append a newly enriched exercise to the output file."""
-        self.enriched_exercises.append(enriched_exercise)
+    def _save_enriched_exercises(self, enriched_exercises: List[Dict[str, Any]]):
+        """Append newly enriched exercises to the output log and mark them as processed.
+
+        A whole batch is written with a single write() and flush(). The log is
+        written before the progress bitmap, so an exercise is never marked as
+        processed without its output.
+        """
+        if not enriched_exercises:
+            return
+
+        # One line per exercise keeps each save O(1) instead of rewriting the whole file
+        data = b"".join(json_dumps(enriched_exercise, newline=True) for enriched_exercise in enriched_exercises)
+
+        # Only the main thread writes (generation runs ahead on a worker but never
+        # touches the files), so lines cannot interleave and need no lock
+        try:
+            self._output_log.write(data)
+            self._output_log.flush()
+        except Exception as e:
+            print(f"Error saving enriched exercises: {e}")
+            return
+
+        previous_count = self._output_count
+        self._output_count += len(enriched_exercises)
+        take_snapshot = previous_count // SNAPSHOT_INTERVAL != self._output_count // SNAPSHOT_INTERVAL
+
+        for enriched_exercise in enriched_exercises:
+            self._save_progress(enriched_exercise["id"])
+
+        if take_snapshot:
+            self.save_snapshot()
+
+    def save_snapshot(self):
+        """Write the full output JSON file and the progress file."""
+        # IDs other than integers (which the bitmap rejects) are listed after the sorted ones
+        int_ids = {exercise_id for exercise_id in self.processed_ids if isinstance(exercise_id, int)}
+        progress_data = {
+            "processed_exercise_ids": sorted(int_ids) + [
+                exercise_id for exercise_id in self.processed_ids if exercise_id not in int_ids
+            ],
+            "last_updated": current_timestamp(),
+            "total_processed": len(self.processed_ids),
+            "model": self.model_name,
+        }
 
         try:
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+            if os.path.exists(OUTPUT_LOG_FILE):
+                jsonl_to_json_array(OUTPUT_LOG_FILE, OUTPUT_FILE)
 
-            with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.enriched_exercises, f, indent=2, ensure_ascii=False)
+            self._flush_progress()
+            write_file_atomic(PROGRESS_FILE, json_dumps(progress_data, indent=True))
         except Exception as e:
-            print(f"Error saving enriched exercise: {e}")
+            print(f"Error saving snapshot: {e}")
+
+    def close(self):
+        """Sync pending progress and close the output logs (safe to call more than once)."""
+        self._flush_progress()
+        for log in (self._output_log, self._prompt_cache_log):
+            if not log.closed:
+                log.close()
+
+    def _load_prompt_cache(self) -> Dict[str, str]:
+        """Load cached responses, keyed by the hash of their generation inputs.
+
+        Responses of the current backend and model are also indexed in the
+        semantic cache, when it is enabled.
+        """
+        prompt_cache = {}
+        semantic_texts = []
+        semantic_responses = []
+        if os.path.exists(PROMPT_CACHE_FILE):
+            try:
+                with open(PROMPT_CACHE_FILE, "rb") as f:
+                    for line_number, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            entry = json_loads(line)
+                        except json.JSONDecodeError:
+                            print(f"Warning: Skipping invalid line {line_number} in {PROMPT_CACHE_FILE}")
+                            continue
+                        prompt_cache[entry["key"]] = entry["response_text"]
+                        if (
+                            entry.get("exercise_text")
+                            and entry.get("backend") == self.provider.backend
+                            and entry.get("model") == self.model_name
+                        ):
+                            semantic_texts.append(entry["exercise_text"])
+                            semantic_responses.append(entry["response_text"])
+            except Exception as e:
+                print(f"Warning: Could not load prompt cache: {e}")
 
-    def _create_prompt(self, exercise: Dict[str, Any]) -> str:
-        """Create a prompt for AI to enrich the exercise."""
-        # Extract existing information
-        exercise_id = exercise.get("id", "Unknown")
-        category = exercise.get("category", {}).get("name", "Unknown")
-        equipment = [eq.get("name", "") for eq in exercise.get("equipment", [])]
-        translations = exercise.get("translations", [])
+        if self._semantic_cache is not None:
+            self._semantic_cache.add(semantic_texts, semantic_responses)
+        return prompt_cache
 
-        # Get existing names (limit to avoid long prompts)
-        existing_info = []
-        for trans in translations[:2]:  # Limit to first 2 translations
-            name = trans.get("name", "")
-            lang = trans.get("language", "")
-            if name:
-                existing_info.append(f"- Name (lang {lang}): {name}")
-            # Skip descriptions to save space
+    def _prompt_key(self, prompt: str) -> str:
+        """Hash everything that determines a response into its cache key.
 
-        # Create a shorter, more concise prompt to avoid token limits
-        prompt = f"""Fitness expert: Enrich this exercise info as JSON.
+        Decoding is greedy, so the same backend, model and prompt always give
+        the same response; changing any of them yields a new key.
+        """
+        key_data = {
+            "backend": self.provider.backend,
+            "model": self.model_name,
+            "temperature": GENERATION_TEMPERATURE,
+            "prompt": prompt,
+        }
+        return hashlib.sha256(json_dumps(key_data, sort_keys=True)).hexdigest()
+
+    def _cache_responses(self, prompt_responses: List[Tuple[str, str]]):
+        """Remember successfully parsed responses so identical prompts reuse them."""
+        entries = []
+        for prompt, response_text in prompt_responses:
+            key = self._prompt_key(prompt)
+            if key in self._prompt_cache:
+                continue
+            self._prompt_cache[key] = response_text
+            entries.append({
+                "key": key,
+                "backend": self.provider.backend,
+                "model": self.model_name,
+                "exercise_text": exercise_text(prompt),
+                "response_text": response_text,
+            })
 
-Exercise: {exercise_id}
-Category: {category}
-Equipment: {', '.join(equipment) if equipment else 'None'}
+        if not entries:
+            return
 
-{chr(10).join(existing_info[:2]) if existing_info else 'No existing info'}
+        if self._semantic_cache is not None:
+            semantic_entries = [entry for entry in entries if entry["exercise_text"]]
+            self._semantic_cache.add(
+                [entry["exercise_text"] for entry in semantic_entries],
+                [entry["response_text"] for entry in semantic_entries],
+            )
 
-Return JSON with this structure:
-{{
-  "primary_muscle": {{"name": "Spanish", "name_en": "English"}},
-  "translations": [
-    {{"name": "Title", "description": "2-3 sentences", "language": 2, "aliases": ["Alt1", "Alt2"], "notes": ["Tip1", "Tip2"]}},
-    {{"name": "Título", "description": "2-3 oraciones", "language": 4, "aliases": ["Alt1", "Alt2"], "notes": ["Consejo1", "Consejo2"]}}
-  ]
-}}
+        try:
+            self._prompt_cache_log.write(b"".join(json_dumps(entry, newline=True) for entry in entries))
+            self._prompt_cache_log.flush()
+        except Exception as e:
+            print(f"Error saving prompt cache: {e}")
+
+    def _generate_responses(self, prompts: List[str]) -> Tuple[List[Optional[str]], List[bool]]:
+        """Generate responses for one batch of prompts (see _generate_batches)."""
+        return next(self._generate_batches([prompts]))
+
+    def _generate_batches(
+        self, prompt_batches: List[List[str]]
+    ) -> Iterator[Tuple[List[Optional[str]], List[bool]]]:
+        """Yield the responses of each batch, only calling the model for prompts not seen before.
+
+        Exercises that share category, equipment and names produce the same
+        prompt, so their cached response is reused instead of regenerated.
+        With the semantic cache enabled, near-duplicate exercises are reused too.
+        A prompt repeated within the run is generated once and its response
+        shared by every exercise that has it.
+
+        Each batch comes with flags telling which responses the model generated
+        for that exact prompt. Only those may be stored in the prompt cache: a
+        semantic match is an approximation for a different prompt.
+        """
+        cached_batches = []
+        dispatched_keys = set()
+        run_responses: Dict[str, Optional[str]] = {}
+
+        def missing_batches() -> Iterator[List[str]]:
+            # Lazy, so a batch sees the responses cached by the batches before it;
+            # batches still in flight are covered by dispatched_keys below
+            for prompts in prompt_batches:
+                keys = [self._prompt_key(prompt) for prompt in prompts]
+                responses = [self._prompt_cache.get(key) for key in keys]
+                missing = [idx for idx, response in enumerate(responses) if response is None]
+
+                if self._semantic_cache is not None and missing:
+                    texts = [exercise_text(prompts[idx]) or prompts[idx] for idx in missing]
+                    for idx, response in zip(missing, self._semantic_cache.lookup(texts)):
+                        responses[idx] = response
+                    missing = [idx for idx in missing if responses[idx] is None]
+
+                # Send each prompt once; repeats wait for the response of the first one
+                to_generate = []
+                duplicates = []
+                for idx in missing:
+                    if keys[idx] in dispatched_keys:
+                        duplicates.append(idx)
+                    else:
+                        dispatched_keys.add(keys[idx])
+                        to_generate.append(idx)
+
+                cached_batches.append((responses, keys, to_generate, duplicates))
+                yield [prompts[idx] for idx in to_generate]
+
+        total = 0
+        generated_total = 0
+        generated_batches = self.provider.generate_batches(missing_batches())
+        for batch_idx, generated in enumerate(generated_batches):
+            responses, keys, to_generate, duplicates = cached_batches[batch_idx]
+            from_model = [False] * len(responses)
+
+            for idx, response_text in zip(to_generate, generated):
+                responses[idx] = response_text
+                run_responses[keys[idx]] = response_text
+                from_model[idx] = True
+            # Batches are yielded in dispatch order, so the first copy is already done
+            for idx in duplicates:
+                responses[idx] = run_responses.get(keys[idx])
+                from_model[idx] = True
+
+            reused = len(responses) - len(to_generate)
+            if reused:
+                print(f"Reusing {reused} cached or duplicate response(s)")
+
+            total += len(responses)
+            generated_total += len(to_generate)
+            yield responses, from_model
+
+        if total > 1:
+            print(
+                f"Generated {generated_total} unique prompt(s) for {total} exercises "
+                f"({1 - generated_total / total:.0%} reused)"
+            )
 
-Rules: language=int (2=English, 4=Spanish), include 2+ aliases and notes.
-- Do not include any markdown formatting, code blocks, or additional text
-- Return only the raw JSON object"""
+    def _create_prompt(self, exercise: Dict[str, Any]) -> str:
+        """Create a prompt for AI to enrich the exercise."""
+        # Extract existing information (the exercise ID is left out: it carries no
+        # meaning for the model and would make every prompt unique, defeating the cache)
+        category = exercise.get("category", {}).get("name", "Unknown")
+        equipment = [eq.get("name", "") for eq in exercise.get("equipment", [])]
+        translations = exercise.get("translations", [])
 
-        return prompt
+        # Get existing names (limited in number and length to keep prompts short;
+        # descriptions are skipped to save space). Names repeated across
+        # languages are listed once, leaving room for a distinct one.
+        existing_lines = []
+        seen_names = set()
+        for trans in translations:
+            name = (trans.get("name") or "").strip()
+            if not name or name in seen_names:
+                continue
+            seen_names.add(name)
+
+            if len(name) > MAX_EXISTING_NAME_CHARS:
+                name = name[:MAX_EXISTING_NAME_CHARS].rstrip() + "…"
+            existing_lines.append(f"- Name (lang {trans.get('language', '')}): {name}")
+            if len(existing_lines) == MAX_EXISTING_NAMES:
+                break
+        existing_info = "\n".join(existing_lines)
+
+        # The static instructions come first so every prompt shares the same prefix
+        return STATIC_PROMPT_PREFIX + EXERCISE_PROMPT_TEMPLATE.format_map({
+            "category": category,
+            "equipment": ", ".join(equipment) if equipment else "None",
+            "existing_info": existing_info or "No existing info",
+        })
 
     def _parse_response(self, response_text: str) -> Optional[Dict[str, str]]:
         """Parse AI response and extract the enriched data."""
         try:
-            # Remove potential markdown code blocks
-            text = response_text.strip()
-            if text.startswith("```"):
-                # Remove markdown code blocks
-                lines = text.split("\n")
-                text = "\n".join(
-                    line for line in lines if not line.strip().startswith("```")
-                )
-                if text.startswith("json"):
-                    text = text[4:]
-                text = text.strip()
+            # Cut the JSON object out of any surrounding prose or code fences
+            text = extract_json_object(response_text)
 
-            # Try to parse the response as JSON
-            data = json.loads(text)
+            # Try to parse the response as JSON, then as the more forgiving JSON5
+            try:
+                data = json_loads(text)
+            except json.JSONDecodeError:
+                if json5 is None:
+                    raise
+                try:
+                    data = json5.loads(text)
+                except ValueError:
+                    raise json.JSONDecodeError("Invalid JSON and JSON5", text, 0)
+
+            if not isinstance(data, dict):
+                print("Error: Response is not a JSON object")
+                return None
 
             # Validate primary_muscle structure
             if "primary_muscle" not in data or not isinstance(data["primary_muscle"], dict):
@@ -311,17 +1798,22 @@ Rules: language=int (2=English, 4=Spanish), include 2+ aliases and notes.
                 return None
 
             muscle = data["primary_muscle"]
-            if "name" not in muscle or "name_en" not in muscle:
-                print("Error: 'primary_muscle' must have both 'name' and 'name_en' properties")
+            if not muscle.keys() >= REQUIRED_MUSCLE_FIELDS:
+                missing = ", ".join(sorted(REQUIRED_MUSCLE_FIELDS - muscle.keys()))
+                print(f"Error: 'primary_muscle' missing required field(s): {missing}")
                 return None
+            for field in sorted(REQUIRED_MUSCLE_FIELDS):
+                if not isinstance(muscle[field], str):
+                    print(f"Error: 'primary_muscle' '{field}' must be a string")
+                    return None
 
             # Validate translations structure
             if "translations" not in data or not isinstance(data["translations"], list):
                 print("Error: Missing or invalid 'translations' array in response")
                 return None
 
-            if len(data["translations"]) != 2:
-                print("Error: 'translations' array must contain exactly 2 translations (English and Spanish)")
+            if len(data["translations"]) != TRANSLATION_COUNT:
+                print(f"Error: 'translations' array must contain exactly {TRANSLATION_COUNT} translations (English and Spanish)")
                 return None
 
             # Validate each translation
@@ -331,27 +1823,33 @@ Rules: language=int (2=English, 4=Spanish), include 2+ aliases and notes.
                     return None
 
                 # Check required fields
-                required_fields = ["name", "description", "language", "aliases", "notes"]
-                for field in required_fields:
-                    if field not in translation:
-                        print(f"Error: Translation {idx} missing required field '{field}'")
-                        return None
-
-                # Validate language is integer (2 or 4)
-                if not isinstance(translation["language"], int) or translation["language"] not in [2, 4]:
-                    print(f"Error: Translation {idx} has invalid language (must be integer 2 or 4)")
+                if not translation.keys() >= REQUIRED_TRANSLATION_FIELDS:
+                    missing = ", ".join(sorted(REQUIRED_TRANSLATION_FIELDS - translation.keys()))
+                    print(f"Error: Translation {idx} missing required field(s): {missing}")
                     return None
 
-                # Validate aliases is array
-                if not isinstance(translation["aliases"], list):
-                    print(f"Error: Translation {idx} 'aliases' must be an array")
-                    return None
+                # Validate name and description are strings
+                for field in ("name", "description"):
+                    if not isinstance(translation[field], str):
+                        print(f"Error: Translation {idx} '{field}' must be a string")
+                        return None
 
-                # Validate notes is array
-                if not isinstance(translation["notes"], list):
-                    print(f"Error: Translation {idx} 'notes' must be an array")
+                # Validate language is one of the integer language IDs (2 or 4)
+                language = translation["language"]
+                if not isinstance(language, int) or isinstance(language, bool) or language not in TRANSLATION_LANGUAGES:
+                    allowed = " or ".join(str(language_id) for language_id in sorted(TRANSLATION_LANGUAGES))
+                    print(f"Error: Translation {idx} has invalid language (must be integer {allowed})")
                     return None
 
+                # Validate aliases and notes are arrays of strings
+                for field in ("aliases", "notes"):
+                    if not isinstance(translation[field], list):
+                        print(f"Error: Translation {idx} '{field}' must be an array")
+                        return None
+                    if not all(isinstance(item, str) for item in translation[field]):
+                        print(f"Error: Translation {idx} '{field}' must only contain strings")
+                        return None
+
             return data
         except json.JSONDecodeError as e:
             print(f"Error parsing AI response as JSON: {e}")
@@ -373,50 +1871,67 @@ Rules: language=int (2=English, 4=Spanish), include 2+ aliases and notes.
             # Create the prompt
             prompt = self._create_prompt(exercise)
 
-            # Make the API call
-            response_text = self.provider.generate_response(prompt)
-
-            if not response_text:
-                print(f"Failed to get response for exercise {exercise_id}")
-                return None
+            # Make the API call (or reuse the response to an identical prompt)
+            responses, from_model = self._generate_responses([prompt])
+            response_text = responses[0]
 
-            # Parse the response
-            enriched_data = self._parse_response(response_text)
+            enriched_exercise = self._build_enriched_exercise(exercise, response_text)
+            if enriched_exercise:
+                self._save_enriched_exercises([enriched_exercise])
+                if from_model[0]:
+                    self._cache_responses([(prompt, response_text)])
+                print(f"✓ Successfully enriched exercise {exercise_id}")
+            return enriched_exercise
 
-            if not enriched_data:
-                print(f"Failed to enrich exercise {exercise_id}")
-                return None
+        except Exception as e:
+            print(f"Error enriching exercise {exercise_id}: {e}")
+            return None
 
-            # Combine original exercise with enriched data
-            enriched_exercise = {
-                "id": exercise_id,
-                "uuid": exercise.get("uuid"),
-                "original_category": exercise.get("category"),
-                "original_equipment": exercise.get("equipment"),
-                "original_translations": exercise.get("translations", []),
-                "enriched_data": enriched_data,
-                "processed_at": datetime.now().isoformat(),
-                "model": self.model_name,
-            }
+    def _build_enriched_exercise(
+        self, exercise: Dict[str, Any], response_text: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Parse a model response for an exercise into its enriched record."""
+        exercise_id = exercise.get("id")
 
-            # Save progress
-            self._save_progress(exercise_id)
-            self._save_enriched_exercise(enriched_exercise)
+        if not response_text:
+            print(f"Failed to get response for exercise {exercise_id}")
+            return None
 
-            print(f"✓ Successfully enriched exercise {exercise_id}")
-            return enriched_exercise
+        # Parse the response
+        enriched_data = self._parse_response(response_text)
 
-        except Exception as e:
-            print(f"Error enriching exercise {exercise_id}: {e}")
+        if not enriched_data:
+            print(f"Failed to enrich exercise {exercise_id}")
             return None
 
+        # Combine original exercise with enriched data
+        enriched_exercise = {
+            "id": exercise_id,
+            "uuid": exercise.get("uuid"),
+            "original_category": exercise.get("category"),
+            "original_equipment": exercise.get("equipment"),
+            "original_translations": exercise.get("translations", []),
+            "enriched_data": enriched_data,
+            "processed_at": current_timestamp(),
+            "model": self.model_name,
+        }
+
+        return enriched_exercise
+
     def process_all_exercises(
-        self, exercises: List[Dict[str, Any]], delay_seconds: float = 1.0
+        self,
+        exercises: Iterable[Dict[str, Any]],
+        batch_size: int = BATCH_SIZE,
     ):
-        """Process all exercises with a delay between requests."""
-        total = len(exercises)
-        processed = len(self.processed_ids)
-        remaining = total - processed
+        """Process all exercises in batches (exercises may be a stream, read once)."""
+        # Filter out finished exercises while reading, so only the remaining ones are kept
+        pending = []
+        total = 0
+        for total, exercise in enumerate(exercises, 1):
+            if exercise.get("id") not in self.processed_ids:
+                pending.append((total, exercise))
+        remaining = len(pending)
+        processed = total - remaining
 
         print(f"\n{'='*60}")
         print(f"Exercise Enrichment Progress")
@@ -425,25 +1940,51 @@ Rules: language=int (2=English, 4=Spanish), include 2+ aliases and notes.
         print(f"Total exercises: {total}")
         print(f"Already processed: {processed}")
         print(f"Remaining: {remaining}")
+        print(f"Batch size: {batch_size}")
         print(f"{'='*60}\n")
 
         if remaining == 0:
             print("All exercises have been processed!")
             return
 
-        for idx, exercise in enumerate(exercises, 1):
-            exercise_id = exercise.get("id")
-
-            if exercise_id in self.processed_ids:
-                continue
-
-            print(f"\n[{idx}/{total}] Processing exercise {exercise_id}...")
-
-            self.enrich_exercise(exercise)
-
-            # Add a delay to avoid rate limiting
-            if idx < total:
-                time.sleep(delay_seconds)
+        # Build every prompt up front; a malformed exercise is skipped, not fatal
+        prompted = []
+        for idx, exercise in pending:
+            try:
+                prompted.append((idx, exercise, self._create_prompt(exercise)))
+            except Exception as e:
+                print(f"[{idx}/{total}] Error creating prompt for exercise {exercise.get('id')}: {e}")
+
+        batches = [prompted[start:start + batch_size] for start in range(0, len(prompted), batch_size)]
+        prompt_batches = [[prompt for _, _, prompt in batch] for batch in batches]
+
+        # Batches are generated in order (concurrently when several replicas run)
+        generated_batches = self._generate_batches(prompt_batches)
+        for batch_idx, (responses, from_model) in enumerate(generated_batches):
+            batch = batches[batch_idx]
+            for idx, exercise, _ in batch:
+                print(f"[{idx}/{total}] Processing exercise {exercise.get('id')}...")
+
+            # Parse every response, then save the whole batch at once
+            enriched_exercises = []
+            cached_responses = []
+            for (_, exercise, prompt), response_text, generated in zip(batch, responses, from_model):
+                try:
+                    enriched_exercise = self._build_enriched_exercise(exercise, response_text)
+                except Exception as e:
+                    print(f"Error enriching exercise {exercise.get('id')}: {e}")
+                    continue
+                if enriched_exercise:
+                    enriched_exercises.append(enriched_exercise)
+                    if generated:
+                        cached_responses.append((prompt, response_text))
+
+            self._save_enriched_exercises(enriched_exercises)
+            self._cache_responses(cached_responses)
+            for enriched_exercise in enriched_exercises:
+                print(f"✓ Successfully enriched exercise {enriched_exercise['id']}")
+
+        self.save_snapshot()
 
         print(f"\n{'='*60}")
         print(f"Processing complete!")
@@ -453,24 +1994,158 @@ Rules: language=int (2=English, 4=Spanish), include 2+ aliases and notes.
         print(f"{'='*60}\n")
 
 
-def load_exercises(file_path: str) -> List[Dict[str, Any]]:
-    """Load exercises from the JSON file."""
+# (second, formatted timestamp) of the last current_timestamp() call
+_timestamp_cache = (0, "")
+
+
+def current_timestamp() -> str:
+    """Return the local time in ISO 8601 with second precision.
+
+    A whole batch is saved within the same second, so the formatted string
+    is cached and only rebuilt when the second changes.
+    """
+    global _timestamp_cache
+    now = int(time.time())
+    if now != _timestamp_cache[0]:
+        _timestamp_cache = (now, datetime.fromtimestamp(now).isoformat())
+    return _timestamp_cache[1]
+
+
+def open_append_log(path: str):
+    """Open a JSONL log for appending binary lines.
+
+    A run killed mid-write can leave a truncated last line. It is cut off
+    first, so the next record starts on a line of its own instead of being
+    glued to the partial one.
+    """
+    f = open(path, "ab")
+    end = f.seek(0, os.SEEK_END)
+    if end:
+        with open(path, "rb") as reader:
+            # Find the last complete line, reading backwards in small blocks
+            pos = end
+            while pos > 0:
+                start = max(0, pos - 4096)
+                reader.seek(start)
+                block = reader.read(pos - start)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    pos = start + newline + 1
+                    break
+                pos = start
+        if pos != end:
+            print(f"Warning: Removing truncated last line from {path}")
+            f.truncate(pos)
+    return f
+
+
+def write_file_atomic(path: str, data: bytes):
+    """Write a file so that readers (and crashes) see either the old or the new content."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def jsonl_to_json_array(input_path: str, output_path: str) -> int:
+    """Stream a JSONL file into an indented JSON array, returning the number of records.
+
+    Records are converted one line at a time, so the whole output never has to
+    be held in memory. The array is written to a temporary file and renamed,
+    so readers never see a half-written file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+
+    count = 0
+    with open(input_path, "rb") as src, open(tmp_path, "wb") as dst:
+        dst.write(b"[")
+        for line_number, line in enumerate(src, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json_loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                print(f"Warning: Skipping invalid line {line_number} in {input_path}")
+                continue
+
+            # Nest each record one level deeper, matching an indented dump of the whole array
+            dst.write(b",\n  " if count else b"\n  ")
+            dst.write(json_dumps(record, indent=True).replace(b"\n", b"\n  "))
+            count += 1
+        dst.write(b"\n]" if count else b"]")
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def load_exercises(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream exercises from the JSON file, one at a time.
+
+    With ijson installed, exercises are parsed incrementally, so the whole
+    input never has to be held in memory. Otherwise the file is parsed in one
+    go from a memory map.
+    """
+    count = 0
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            exercises = json.load(f)
-            print(f"Loaded {len(exercises)} exercises from {file_path}")
-            return exercises
+        with open(file_path, "rb") as f:
+            if ijson is not None:
+                for exercise in ijson.items(f, "item", use_float=True):
+                    count += 1
+                    yield exercise
+            else:
+                # Parse straight from the memory-mapped file, without an intermediate string
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as data:
+                        exercises = json_loads(data)
+                for exercise in exercises:
+                    count += 1
+                    yield exercise
+        print(f"Loaded {count} exercises from {file_path}")
     except FileNotFoundError:
         print(f"Error: Input file not found: {file_path}")
         print(f"Please copy the exercises file to: {os.path.dirname(file_path)}")
         sys.exit(1)
-    except json.JSONDecodeError as e:
+    except ValueError as e:
+        # json.JSONDecodeError subclasses ValueError; mmap raises it for empty files
         print(f"Error: Invalid JSON in input file: {e}")
         sys.exit(1)
+    except Exception as e:
+        if ijson is not None and isinstance(e, ijson.JSONError):
+            print(f"Error: Invalid JSON in input file: {e}")
+            sys.exit(1)
+        raise
+
 
+def model_selection(model_name: str) -> tuple[str, str, Optional[str]]:
+    """Return the (model_id, model_name, quantization) of an AVAILABLE_MODELS key."""
+    model_info = AVAILABLE_MODELS[model_name]
+    return model_info["name"], model_name, model_info.get("quantization")
+
+
+def preset_choice(env_var: str, options: Dict[str, Any]) -> Optional[str]:
+    """Return the option named by an environment variable, if it is set and valid."""
+    choice = os.environ.get(env_var, "").strip()
+    if not choice:
+        return None
+    if choice not in options:
+        print(f"⚠️  {env_var}={choice} no es válido (opciones: {', '.join(options)})")
+        return None
+    print(f"Usando {env_var}={choice}")
+    return choice
+
+
+def select_model() -> tuple[str, str, Optional[str]]:
+    """Prompt user to select a local model (skipped when ENRICHER_MODEL is set)."""
+    preset = preset_choice("ENRICHER_MODEL", AVAILABLE_MODELS)
+    if preset is not None:
+        return model_selection(preset)
 
-def select_model() -> tuple[str, str]:
-    """Prompt user to select a local model."""
     print("\n" + "=" * 60)
     print("Selecciona un Modelo Local de LLM")
     print("=" * 60)
@@ -490,36 +2165,114 @@ def select_model() -> tuple[str, str]:
         try:
             idx = int(choice) - 1
             if 0 <= idx < len(model_keys):
-                selected_key = model_keys[idx]
-                model_id = AVAILABLE_MODELS[selected_key]["name"]
-                model_name = selected_key
-                return model_id, model_name
+                return model_selection(model_keys[idx])
             else:
                 print(f"Opción inválida. Por favor ingresa un número entre 1 y {len(model_keys)}.")
         except ValueError:
             print(f"Opción inválida. Por favor ingresa un número entre 1 y {len(model_keys)}.")
 
 
-def create_local_provider(model_id: str, model_name: str) -> LocalLLMProvider:
+def select_backend() -> str:
+    """Prompt user to select an inference backend (skipped when ENRICHER_BACKEND is set)."""
+    preset = preset_choice("ENRICHER_BACKEND", AVAILABLE_BACKENDS)
+    if preset is not None:
+        return preset
+
+    print("\n" + "=" * 60)
+    print("Selecciona el Backend de Inferencia")
+    print("=" * 60)
+    print()
+
+    backend_keys = list(AVAILABLE_BACKENDS.keys())
+    for idx, key in enumerate(backend_keys, 1):
+        print(f"  {idx}. {AVAILABLE_BACKENDS[key]['description']}")
+    print()
+
+    while True:
+        choice = input(f"Ingresa tu elección (1-{len(backend_keys)}): ").strip()
+        try:
+            idx = int(choice) - 1
+            if 0 <= idx < len(backend_keys):
+                return backend_keys[idx]
+            else:
+                print(f"Opción inválida. Por favor ingresa un número entre 1 y {len(backend_keys)}.")
+        except ValueError:
+            print(f"Opción inválida. Por favor ingresa un número entre 1 y {len(backend_keys)}.")
+
+
+def create_local_provider(
+    model_id: str,
+    model_name: str,
+    quantization: Optional[str] = None,
+    backend: str = "transformers",
+    replicas: int = 1,
+) -> BaseLLMProvider:
     """Create a local LLM provider instance."""
+    if replicas > 1:
+        return ReplicaPoolProvider(model_id, model_name, quantization, backend, replicas)
+
+    # Thread settings must be in the environment before torch is imported
+    configure_threading()
+
+    if backend == "transformers":
+        try:
+            lazy_imports()
+        except ImportError:
+            print(f"Error: Falta instalar dependencias requeridas")
+            print(f"Ejecuta: pip install -r requirements.txt")
+            sys.exit(1)
+
     try:
-        return LocalLLMProvider(model_id, model_name)
+        if backend == "llama.cpp":
+            model_info = AVAILABLE_MODELS[model_name]
+            return LlamaCppProvider(model_info["gguf_repo"], model_info["gguf_file"], model_name)
+        return LocalLLMProvider(model_id, model_name, quantization)
     except Exception as e:
         raise Exception(f"Error al crear el proveedor de modelo local: {e}")
 
 
+def pin_to_numa_node():
+    """Re-run the script under numactl, bound to NUMA node 0.
+
+    On multi-socket machines, threads and memory spread across nodes pay
+    remote-memory latency on every weight read. Single-node machines and
+    systems without numactl are left untouched.
+    """
+    if os.environ.get("NUMACTL_DONE") or not os.path.exists("/sys/devices/system/node/node1"):
+        return
+
+    numactl = shutil.which("numactl")
+    if numactl is None:
+        return
+
+    os.environ["NUMACTL_DONE"] = "1"
+    os.execv(numactl, [numactl, "--cpunodebind=0", "--membind=0", sys.executable] + sys.argv)
+
+
 def main():
     """Main function to run the enrichment process."""
+    # Load settings such as ENRICHER_MODEL / ENRICHER_BACKEND / ENRICHER_REPLICAS from a .env file
+    if load_dotenv is not None:
+        load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+    # Several replicas are pinned to their own NUMA nodes; a single one is bound to node 0
+    replicas = select_replica_count()
+    if replicas == 1:
+        pin_to_numa_node()
+
     print(f"\n{'='*60}")
     print(f"Exercise Enrichment Script - Modelos Locales")
     print(f"{'='*60}\n")
 
     # Select local model
-    model_id, model_name = select_model()
+    model_id, model_name, quantization = select_model()
+
+    # Select inference backend
+    backend = select_backend()
 
     # Create local provider instance
     try:
-        provider = create_local_provider(model_id, model_name)
+        provider = create_local_provider(model_id, model_name, quantization, backend, replicas)
     except Exception as e:
         print(f"Error al inicializar el modelo local: {e}")
         sys.exit(1)
@@ -530,14 +2283,23 @@ def main():
     # Initialize enricher
     enricher = ExerciseEnricher(provider, model_name)
 
+    # Treat SIGTERM (e.g. from kill or a job scheduler) like Ctrl+C, so progress is saved
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
     # Process all exercises
+    interrupted = False
     try:
-        # Delay can be 0 or very low since we're running locally
-        enricher.process_all_exercises(exercises, delay_seconds=0.5)
+        enricher.process_all_exercises(exercises, batch_size=BATCH_SIZE)
     except KeyboardInterrupt:
-        print("\n\nProceso interrumpido por el usuario. El progreso ha sido guardado.")
+        interrupted = True
+        enricher.save_snapshot()
+        print("\n\nProceso interrumpido. El progreso ha sido guardado.")
         print(f"Ejecuta el script nuevamente para continuar desde donde lo dejaste.")
         sys.exit(0)
+    finally:
+        enricher.close()
+        # Don't wait for batches that are still queued on the replicas
+        provider.close(terminate=interrupted)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+JSONL to JSON Converter
+=======================
+Converts the append-only output log (one enriched exercise per line) into a
+single JSON array, for consumers that need the whole list in one document.
+
+enrich_exercises.py already writes this array as a periodic snapshot; this
+script rebuilds it on demand, e.g. after an interrupted run.
+
+Usage: python jsonl_to_json.py [input.jsonl] [output.json]
+"""
+
+import sys
+
+from enrich_exercises import OUTPUT_FILE, OUTPUT_LOG_FILE, jsonl_to_json_array
+
+
+def main():
+    """Main entry point."""
+    input_path = sys.argv[1] if len(sys.argv) > 1 else OUTPUT_LOG_FILE
+    output_path = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_FILE
+
+    try:
+        count = jsonl_to_json_array(input_path, output_path)
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo: {input_path}")
+        sys.exit(1)
+
+    print(f"✓ {count} ejercicios convertidos: {input_path} -> {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Tests for LocalLLMProvider generation helpers (need torch and transformers)."""
+
+import importlib.util
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import enrich_exercises  # noqa: E402
+
+HAS_TRANSFORMERS = importlib.util.find_spec("transformers") is not None
+HAS_TORCH = (
+    importlib.util.find_spec("torch") is not None
+    and importlib.util.find_spec("transformers") is not None
+)
+
+
+class CharTokenizer:
+    """Minimal character-level tokenizer, enough for the prefix cache helpers."""
+
+    pad_token_id = 0
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True, truncation=False, max_length=None):
+        texts = [text] if isinstance(text, str) else text
+        input_ids = [[1 + ord(char) % 60 for char in item][:max_length] for item in texts]
+        if return_tensors == "pt":
+            return {"input_ids": enrich_exercises.torch.tensor(input_ids)}
+        return {"input_ids": input_ids}
+
+
+@unittest.skipUnless(HAS_TORCH, "torch and transformers are not installed")
+class PrefixCacheTest(unittest.TestCase):
+    def setUp(self):
+        enrich_exercises.lazy_imports()
+        transformers = enrich_exercises.transformers
+
+        # Tiny randomly initialized model, no download needed
+        config = transformers.LlamaConfig(
+            vocab_size=64,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+        )
+        provider = enrich_exercises.LocalLLMProvider.__new__(enrich_exercises.LocalLLMProvider)
+        provider.model_id = "test/tiny-llama"
+        provider.dtype = enrich_exercises.torch.float32
+        provider.tokenizer = CharTokenizer()
+        provider.model = transformers.LlamaForCausalLM(config).eval()
+        provider.prefix_kv = None
+        self.provider = provider
+
+    def test_batch_of_two_uses_prefix_cache(self):
+        torch = enrich_exercises.torch
+        self.provider._build_prefix_cache()
+        self.assertIsNotNone(self.provider.prefix_kv)
+
+        prompts = [
+            enrich_exercises.STATIC_PROMPT_PREFIX + "Category: Arms",
+            enrich_exercises.STATIC_PROMPT_PREFIX + "Category: Legs\nEquipment: Barbell",
+        ]
+        inputs = self.provider._prefixed_inputs(prompts)
+        self.assertIsNotNone(inputs)
+        self.assertEqual(inputs["input_ids"].shape[0], 2)
+
+        with torch.inference_mode():
+            output_ids = self.provider.model.generate(
+                **inputs, max_new_tokens=2, do_sample=False, pad_token_id=0
+            )
+        self.assertEqual(output_ids.shape[0], 2)
+
+    def test_unexpandable_prefix_falls_back_to_full_prompts(self):
+        self.provider._build_prefix_cache()
+        self.provider.prefix_kv = object()  # Has no batch_repeat_interleave
+
+        prompts = [enrich_exercises.STATIC_PROMPT_PREFIX + "a", enrich_exercises.STATIC_PROMPT_PREFIX + "b"]
+        self.assertIsNone(self.provider._prefixed_inputs(prompts))
+        self.assertIsNone(self.provider.prefix_kv)
+
+
+@unittest.skipUnless(HAS_TRANSFORMERS, "transformers is not installed")
+class QuantizedCacheKwargsTest(unittest.TestCase):
+    def _kwargs_with(self, installed):
+        """Build the kwargs as if only the given quantization package were installed."""
+        def find_spec(name):
+            return object() if name == installed else None
+
+        with mock.patch.object(enrich_exercises.importlib.util, "find_spec", find_spec):
+            return enrich_exercises.quantized_cache_kwargs()
+
+    def test_generation_config_accepts_hqq_kwargs(self):
+        import transformers
+
+        kwargs = self._kwargs_with("hqq")
+        config = transformers.GenerationConfig(**kwargs)
+        self.assertEqual(config.cache_config.backend, "HQQ")
+        self.assertEqual(config.cache_config.axis_key, 0)
+        self.assertEqual(config.cache_config.axis_value, 0)
+
+    def test_generation_config_accepts_quanto_kwargs(self):
+        import transformers
+
+        kwargs = self._kwargs_with("optimum.quanto")
+        config = transformers.GenerationConfig(**kwargs)
+        self.assertEqual(config.cache_config.backend, "quanto")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for ExerciseEnricher._parse_response validation."""
+
+import copy
+import io
+import json
+import os
+import sys
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import enrich_exercises  # noqa: E402
+
+VALID_RESPONSE = {
+    "primary_muscle": {"name": "Pectoral", "name_en": "Chest"},
+    "translations": [
+        {
+            "name": "Bench Press",
+            "description": "Press the barbell up from the chest.",
+            "language": 2,
+            "aliases": ["Flat Bench Press"],
+            "notes": ["Keep the feet on the floor."],
+        },
+        {
+            "name": "Press de Banca",
+            "description": "Empuja la barra desde el pecho.",
+            "language": 4,
+            "aliases": ["Press Plano"],
+            "notes": ["Mantén los pies en el suelo."],
+        },
+    ],
+}
+
+
+class ParseResponseTest(unittest.TestCase):
+    def setUp(self):
+        # _parse_response does not touch any enricher state
+        self.enricher = enrich_exercises.ExerciseEnricher.__new__(enrich_exercises.ExerciseEnricher)
+
+    def parse(self, data):
+        with redirect_stdout(io.StringIO()) as output:
+            result = self.enricher._parse_response(json.dumps(data))
+        return result, output.getvalue()
+
+    def with_translation_field(self, field, value):
+        data = copy.deepcopy(VALID_RESPONSE)
+        data["translations"][0][field] = value
+        return data
+
+    def test_valid_response(self):
+        result, _ = self.parse(VALID_RESPONSE)
+        self.assertEqual(result, VALID_RESPONSE)
+
+    def test_rejects_non_string_name(self):
+        result, output = self.parse(self.with_translation_field("name", 123))
+        self.assertIsNone(result)
+        self.assertIn("'name' must be a string", output)
+
+    def test_rejects_null_description(self):
+        result, output = self.parse(self.with_translation_field("description", None))
+        self.assertIsNone(result)
+        self.assertIn("'description' must be a string", output)
+
+    def test_rejects_non_string_aliases(self):
+        result, output = self.parse(self.with_translation_field("aliases", [1, {}]))
+        self.assertIsNone(result)
+        self.assertIn("'aliases' must only contain strings", output)
+
+    def test_rejects_non_string_notes(self):
+        result, output = self.parse(self.with_translation_field("notes", ["ok", None]))
+        self.assertIsNone(result)
+        self.assertIn("'notes' must only contain strings", output)
+
+
+if __name__ == "__main__":
+    unittest.main()